@@ -0,0 +1,100 @@
+"""Keeps rendered plots by hash of their data and settings, so unchanged plots are not rendered again."""
+
+
+import hashlib
+import os
+import shutil
+import time
+
+import pandas as pd
+
+chart_cache_dir = "output/chart_cache"
+max_cache_size_mb = 200
+max_cache_age_days = 60
+
+
+class ChartCache:
+    """
+    Content-addressed cache of PNG files. Key is a hash of aggregated plot data, chart type, title, colours and
+    Plot settings. On cache hit the PNG is copied to output instead of rendering it again.
+
+    :param cache_dir: directory of cached PNG files.
+    :param max_size_mb: oldest files are removed when cache is larger.
+    :param max_age_days: files not used for longer are removed.
+    """
+
+    def __init__(self, cache_dir: str = chart_cache_dir, max_size_mb: float = max_cache_size_mb,
+                 max_age_days: float = max_cache_age_days):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_mb * 1024 * 1024
+        self.max_age_seconds = max_age_days * 24 * 60 * 60
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """
+        Hashes plot data and settings. Pandas objects are hashed by values, index and column names.
+
+        :return: hex digest
+        """
+        digest = hashlib.sha256()
+        for part in parts:
+            if isinstance(part, (pd.Series, pd.DataFrame)):
+                digest.update(pd.util.hash_pandas_object(part, index=True).to_numpy().tobytes())
+                if isinstance(part, pd.DataFrame):
+                    digest.update(repr(list(part.columns)).encode('utf-8'))
+            elif isinstance(part, dict):
+                digest.update(repr(sorted(part.items(), key=str)).encode('utf-8'))
+            else:
+                digest.update(repr(part).encode('utf-8'))
+            digest.update(b"|")
+        return digest.hexdigest()
+
+    def get_cache_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.png")
+
+    def get(self, key: str, file_path: str) -> bool:
+        """
+        Copies cached PNG to file_path.
+
+        :return: True on cache hit
+        """
+        cache_path = self.get_cache_path(key)
+        if not os.path.exists(cache_path):
+            self.misses += 1
+            return False
+        shutil.copyfile(cache_path, file_path)
+        # Used files are kept longest
+        os.utime(cache_path)
+        self.hits += 1
+        print(f"Plot copied from cache to: {file_path}")
+        return True
+
+    def put(self, key: str, file_path: str):
+        """Stores rendered PNG."""
+        if os.path.exists(file_path):
+            shutil.copyfile(file_path, self.get_cache_path(key))
+
+    def evict(self):
+        """Removes files unused for longer than max age, then least recently used files until cache fits max size."""
+        files = []
+        for filename in os.listdir(self.cache_dir):
+            cache_path = os.path.join(self.cache_dir, filename)
+            stat = os.stat(cache_path)
+            files.append((stat.st_mtime, stat.st_size, cache_path))
+        files.sort()
+
+        now = time.time()
+        total_size = sum(size for _, size, _ in files)
+        for mtime, size, cache_path in files:
+            if now - mtime <= self.max_age_seconds and total_size <= self.max_size_bytes:
+                break
+            os.remove(cache_path)
+            total_size -= size
+            self.evicted += 1
+
+    def get_summary(self) -> str:
+        return f"Chart cache: {self.hits} hits, {self.misses} misses, {self.evicted} evicted."
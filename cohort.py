@@ -0,0 +1,123 @@
+"""Splits students into cohorts and counts EX progress labels per cohort."""
+
+
+import re
+
+import numpy as np
+import pandas as pd
+
+# Upper bounds (days since last active) of activity recency buckets
+activity_buckets = {
+    7: "Aktiivne viimase 7 päeva jooksul",
+    14: "Aktiivne 8-14 päeva tagasi",
+    30: "Aktiivne 15-30 päeva tagasi",
+    np.inf: "Aktiivne üle 30 päeva tagasi"
+}
+no_activity_label = "Logides puudub"
+
+support_keyword = "probleemid"
+
+
+class Cohorts:
+    """
+    Precomputes row positions of student segments once and aggregates EX progress labels for all
+    segments in a single grouped operation, without copying the students frame per segment.
+
+    :param df: students DataFrame (Student.df).
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.segments = {}
+
+    def add_segment(self, name: str, mask):
+        """
+        Stores positions of rows where mask is True.
+
+        :param name: segment name, used in plot titles
+        :param mask: boolean array-like with one value per student
+        """
+        positions = np.flatnonzero(np.asarray(mask, dtype=bool))
+        if len(positions) > 0:
+            self.segments[name] = positions
+
+    def add_all_students(self, name="Kõik tudengid"):
+        self.segments[name] = np.arange(len(self.df))
+
+    def add_micro_segments(self):
+        """Adds microdegree and non-microdegree segments, if column 'micro' exists."""
+        if 'micro' not in self.df.columns:
+            return
+        micro = self.df['micro'].fillna(False).to_numpy(dtype=bool)
+        self.add_segment("Mikrokraad", micro)
+        self.add_segment("Mitte-mikrokraad", ~micro)
+
+    def add_group_segments(self, column='groups'):
+        """Adds one segment per lab group. Student may belong to several comma-separated groups."""
+        if column not in self.df.columns:
+            return
+        groups = self.df[column].reset_index(drop=True).dropna().astype(str).str.split(',').explode().str.strip()
+        groups = groups[groups != ""]
+        for group, positions in groups.groupby(groups).groups.items():
+            self.segments[group] = np.unique(positions.to_numpy())
+
+    def add_activity_segments(self, column='last_active'):
+        """Adds segments by days since last active, see activity_buckets."""
+        if column not in self.df.columns:
+            return
+        days = pd.to_numeric(self.df[column], errors='coerce').to_numpy(dtype=float)
+        codes = np.digitize(days, list(activity_buckets)[:-1], right=True)
+        for code, label in enumerate(activity_buckets.values()):
+            self.add_segment(label, (codes == code) & ~np.isnan(days))
+        self.add_segment(no_activity_label, np.isnan(days))
+
+    def add_support_segment(self, name="Abi vajavad tudengid", keyword=support_keyword):
+        """Adds students with at least one auto-generated comment in columns '<week>_probleemid'."""
+        support_columns = [col for col in self.df.columns if keyword in str(col)]
+        if not support_columns:
+            return
+        self.add_segment(name, self.df[support_columns].notna().any(axis=1))
+
+    def count_progress(self, list_of_columns) -> pd.DataFrame:
+        """
+        Counts progress labels of all segments in one groupby over the narrow EX columns.
+
+        :param list_of_columns: EX columns, e.g. ['EX11', 'EX12']
+        :return: DataFrame with MultiIndex (segment, column) and one column per progress label
+        """
+        names = list(self.segments)
+        sizes = [len(self.segments[name]) for name in names]
+        positions = np.concatenate([self.segments[name] for name in names])
+        labels = self.df[list_of_columns].to_numpy()[positions]
+
+        num_columns = len(list_of_columns)
+        segment_codes = np.repeat(np.arange(len(names)), sizes)
+        long_df = pd.DataFrame({
+            'segment': pd.Categorical.from_codes(np.repeat(segment_codes, num_columns), categories=names),
+            'column': pd.Categorical.from_codes(np.tile(np.arange(num_columns), len(positions)),
+                                                categories=list_of_columns),
+            'label': labels.ravel()
+        })
+        counts = long_df.groupby(['segment', 'column', 'label'], observed=True).size()
+        counts = counts.unstack('label', fill_value=0)
+        return counts.reindex(columns=sorted(counts.columns))
+
+    def progress_percentages(self, counts: pd.DataFrame, segment: str) -> pd.DataFrame:
+        """
+        Converts counts of one segment to percentages for Plot.plot_stacked_percentages.
+
+        :param counts: result of count_progress
+        :param segment: segment name
+        :return: DataFrame indexed by EX column with one column per progress label
+        """
+        segment_counts = counts.xs(segment, level='segment')
+        segment_counts = segment_counts.loc[:, segment_counts.sum() > 0]
+        return segment_counts.div(segment_counts.sum(axis=1), axis=0).fillna(0) * 100
+
+    def get_size(self, segment: str) -> int:
+        return len(self.segments[segment])
+
+    @staticmethod
+    def make_filename_part(segment: str) -> str:
+        """Makes segment name safe for file names."""
+        return re.sub(r'\W+', '_', segment).strip('_')
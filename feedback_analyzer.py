@@ -2,9 +2,11 @@
 
 
 from datetime import datetime
+import numpy as np
 import pandas as pd
 import os
 from weekly_metrics import WeeklyMetrics
+from name_matcher import NameMatcher
 
 today = datetime.now().strftime("%Y-%m-%d_%H-%M")
 output_dir = "output"
@@ -18,13 +20,15 @@ class FeedbackAnalyzer:
     :param feedback_data (pd.DataFrame): df containing student feedback.
     """
 
-    def __init__(self, weekly_metrics: WeeklyMetrics):
+    def __init__(self, weekly_metrics: WeeklyMetrics, name_matcher: NameMatcher = None):
         """
         Initializes the FeedbackAnalyzer with student feedback data.
 
         :param: weekly_metrics WeeklyMetrics.
+        :param: name_matcher NameMatcher of students, built from students file if not given.
         """
         self.weekly_metrics = weekly_metrics
+        self.name_matcher = name_matcher
         self.df = weekly_metrics.get_weekly_df()
         self.week = weekly_metrics.get_week()
 
@@ -35,6 +39,8 @@ class FeedbackAnalyzer:
         :param self_perception:
         :return: str
         """
+        if pd.isna(self_perception):
+            return None
         self_perception = self_perception.lower()
         if "neutraalne" in self_perception or "negatiivne" in self_perception:
             return f"{self_perception.title()} enesetunne."
@@ -47,24 +53,26 @@ class FeedbackAnalyzer:
         :return: str
         """
         median_time = self.weekly_metrics.get_median_time_spent()
-        if time_spent is not None:  # Ensure time_spent is valid
+        if pd.notna(time_spent):  # Ensure time_spent is valid
             extra_time = time_spent - median_time
             if extra_time >= 5:
                 # Longer comment needed if used in Charon export
                 # return f"Kulutas {round(extra_time, 1)} h kauem kui mediaan ({round(median_time, 1)}) {self.week}. nädalal."
                 return f"{round(extra_time, 1)} h mediaanist rohkem."
 
-    def label_auto_comment(self, low_self_perception, high_time_spent):
+    def label_auto_comment(self, low_self_perception: pd.Series, high_time_spent: pd.Series) -> pd.Series:
         """
-        Helper function to concatenate all labels.
+        Helper function to concatenate all labels. Missing labels are NaN in pandas 3 str columns, NaN is truthy,
+        so both labels are checked with notna.
 
-        :param low_self_perception, high_time_spent:
-        :return: str
+        :param low_self_perception, high_time_spent: columns of labels
+        :return: Series of comments, None if either label is missing
         """
-        if low_self_perception and high_time_spent:
-            # Longer version for Charon. Shorter version for students.xlsx
-            # return f"N {self.week}. {high_time_spent} {low_self_perception}"
-            return f"{high_time_spent} {low_self_perception}"
+        # Longer version for Charon. Shorter version for students.xlsx
+        # return f"N {self.week}. {high_time_spent} {low_self_perception}"
+        has_both = low_self_perception.notna() & high_time_spent.notna()
+        comments = high_time_spent.astype(object) + " " + low_self_perception.astype(object)
+        return pd.Series(np.where(has_both, comments, None), index=self.df.index, dtype=object)
 
     def add_labels(self):
         """
@@ -74,31 +82,53 @@ class FeedbackAnalyzer:
         """
         self.df['low_self_perception'] = self.df['self_perception'].apply(self.label_low_self_perception)
         self.df['high_time_spent'] = self.df['time_spent'].apply(self.label_high_time_spent)
-        self.df['auto_comment'] = self.df.apply(lambda row: self.label_auto_comment(row['low_self_perception'], row['high_time_spent']), axis=1)
+        self.df['auto_comment'] = self.label_auto_comment(self.df['low_self_perception'], self.df['high_time_spent'])
         return self.df
 
+    def get_student_feedback(self, df_students: pd.DataFrame = None) -> pd.DataFrame:
+        """
+        Matches names in feedback to names in grades. Run add_labels first.
+
+        :param df_students: students file, used to build NameMatcher if not given
+        :return: df with one row per student: full_name, time_spent, in_person, auto_comment
+        """
+        if self.name_matcher is None:
+            if df_students is None:
+                df_students = pd.read_excel(students_file)
+            self.name_matcher = NameMatcher(df_students['full_name'])
+        df_feedback = self.df[['full_name', 'time_spent', 'in_person', 'auto_comment']].copy()
+        df_feedback['full_name'] = self.name_matcher.resolve_all(df_feedback['full_name'], f"N{self.week} tagasiside")
+        return df_feedback.dropna(subset=['full_name']).drop_duplicates(subset=['full_name'], keep='last')
+
     def add_to_student_file(self):
         """Adds feedback to students.xlsx"""
         df_students = pd.read_excel(students_file)
+        df_feedback = self.get_student_feedback(df_students)
+
+        # Remove columns of this week, if week is processed again
+        week_columns = [f"{self.week}_ajakulu", f"{self.week}_kohal", f"{self.week}_probleemid"]
+        df_students.drop(columns=week_columns, errors='ignore', inplace=True)
 
         # Merge time_spent with custom suffixes to avoid conflicts
-        df_students = pd.merge(df_students, self.df[['full_name', 'time_spent']], on='full_name', how='left')
+        df_students = pd.merge(df_students, df_feedback[['full_name', 'time_spent']], on='full_name', how='left')
         df_students.rename(columns={"time_spent": f"{self.week}_ajakulu"}, inplace=True)
 
         # Merge in_person with custom suffixes
-        df_students = pd.merge(df_students, self.df[['full_name', 'in_person']], on='full_name', how='left')
+        df_students = pd.merge(df_students, df_feedback[['full_name', 'in_person']], on='full_name', how='left')
         df_students.rename(columns={"in_person": f"{self.week}_kohal"}, inplace=True)
 
         # Merge auto_comment with custom suffixes
-        df_students = pd.merge(df_students, self.df[['full_name', 'auto_comment']], on='full_name', how='left')
+        df_students = pd.merge(df_students, df_feedback[['full_name', 'auto_comment']], on='full_name', how='left')
         df_students.rename(columns={"auto_comment": f"{self.week}_probleemid"}, inplace=True)
 
         df_students.to_excel(students_file, index=False)
 
-    def create_csv_of_students_with_comments(self):
+    def create_csv_of_students_with_comments(self, label: str = today):
         """
         Generates csv of students with comments.
 
+        :param label: prefix of output folder and file, date and time by default
+
         :return: csv to export comments to Charon
         """
         num_students = self.df.shape[0]
@@ -110,9 +140,9 @@ class FeedbackAnalyzer:
         print(f"Student summary for week {self.week}"
               f"\nNeed support: {df_students_with_comments.shape[0]}/{num_students}\n"
               f"Students: {', '.join(names)}\n---")
-        path_to_output = f"{output_dir}/{today}_Importimiseks_abi_vajavad_tudengid"
+        path_to_output = f"{output_dir}/{label}_Importimiseks_abi_vajavad_tudengid"
         os.makedirs(path_to_output, exist_ok=True)
-        filepath = f"{path_to_output}/{today}_N{self.week}_Abi_vajavad_tudengid.csv"
+        filepath = f"{path_to_output}/{label}_N{self.week}_Abi_vajavad_tudengid.csv"
         # Encoding specified to enable opening in Excel
         df_students_with_comments.to_csv(filepath, index=False, encoding='utf-8-sig')
         print("Generated file \"{filepath}\"".format(filepath=filepath))
@@ -0,0 +1,68 @@
+"""Reads all input files concurrently."""
+
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import time
+
+import pandas as pd
+
+from weekly_metrics import WeeklyMetrics
+
+
+def read_excel(filepath: str) -> pd.DataFrame:
+    """Parses Excel file. Module-level function, so it can run in another process."""
+    return pd.read_excel(filepath)
+
+
+def read_name_list(filepath: str) -> list:
+    """Reads one name per line, e.g. micro.txt or no_declaration.txt."""
+    with open(filepath, 'r') as file:
+        return file.read().splitlines()
+
+
+class InputBundle:
+    """
+    Parsed input files consumed by Student, WeeklyMetrics and FeedbackAnalyzer. Student sets grades and activity_log
+    to None after reading them, so raw grades are not kept for the whole run.
+
+    :param grades: grades export from Moodle
+    :param activity_log: log export from Moodle
+    :param micro_students: names of microdegree students
+    :param no_declaration_students: names of students without declaration
+    :param weekly_df: feedback of all weeks, see WeeklyMetrics.read_weekly_csvs
+    """
+
+    def __init__(self, grades: pd.DataFrame, activity_log: pd.DataFrame, micro_students: list,
+                 no_declaration_students: list, weekly_df: pd.DataFrame):
+        self.grades = grades
+        self.activity_log = activity_log
+        self.micro_students = micro_students
+        self.no_declaration_students = no_declaration_students
+        self.weekly_df = weekly_df
+
+
+def load_inputs(grades_filepath: str, log_filepath: str, micro_filepath: str, no_declaration_filepath: str,
+                weekly_csvs: list) -> InputBundle:
+    """
+    Reads input files at the same time: Excel files in separate processes (parsing is CPU-heavy),
+    text and csv files in threads. Takes as long as the slowest file, not the sum of all files.
+
+    :return: InputBundle
+    """
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=2) as processes, ThreadPoolExecutor() as threads:
+        grades = processes.submit(read_excel, grades_filepath)
+        activity_log = processes.submit(read_excel, log_filepath)
+        micro_students = threads.submit(read_name_list, micro_filepath)
+        no_declaration_students = threads.submit(read_name_list, no_declaration_filepath)
+        weekly_dfs = [threads.submit(WeeklyMetrics.read_weekly_csv, csv_path) for csv_path in weekly_csvs]
+
+        inputs = InputBundle(
+            grades=grades.result(),
+            activity_log=activity_log.result(),
+            micro_students=micro_students.result(),
+            no_declaration_students=no_declaration_students.result(),
+            weekly_df=WeeklyMetrics.combine_weekly_dfs([weekly_df.result() for weekly_df in weekly_dfs])
+        )
+    print(f"Loaded {2 + 2 + len(weekly_csvs)} input files in {time.perf_counter() - start:.1f} s")
+    return inputs
@@ -3,10 +3,22 @@
 
 from datetime import datetime
 import os
+import sys
+
+import pandas as pd
 
 from weekly_metrics import WeeklyMetrics
-from student import Student
+from student import Student, activity_log
 from feedback_analyzer import FeedbackAnalyzer
+from text_analyzer import TextAnalyzer
+from watcher import InputWatcher, log_prefix, grades_keyword
+from chart_cache import ChartCache
+from memory_report import MemoryReport
+from input_loader import InputBundle, load_inputs
+
+# Copy-on-write avoids copying frames on selection and rename. It is default from pandas 3.0
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
 
 grades = "input/ITI0102-2024 Hinded.xlsx"
 micro_filepath = "input/micro.txt"
@@ -18,14 +30,20 @@ today = datetime.now().strftime("%Y-%m-%d_%H-%M")
 #checked_log = "output/checked_weekly_data.log"
 output_dir = "output"
 students_file = f"{output_dir}/students.xlsx"
-# !!! Get automatically from grades in the future.
-all_students = 366
+# Watch mode updates output folders with this prefix in place
+watch_label = "jooksev"
 
-if __name__ == "__main__":
-    os.makedirs(input_dir, exist_ok=True)
-    os.makedirs(output_dir, exist_ok=True)
 
-    students = Student(grades)
+def update_students(log_filepath: str = activity_log, inputs: InputBundle = None, grades_filepath: str = grades):
+    """
+    Creates students file from grades, logs and lists. EX progress plots are made in update_summary,
+    after feedback of all weeks is added.
+
+    :param inputs: files loaded by load_inputs, files are read here if not provided
+    :param grades_filepath: grades export, used if inputs are not provided
+    :return: Student
+    """
+    students = Student(grades_filepath, log_filepath, inputs)
     students.add_column_micro(micro_filepath)
 
     students.add_column_weekly_points_without_defence(14, 19, 1)
@@ -73,17 +91,125 @@ if __name__ == "__main__":
     students.add_column_weekly_points_without_defence(182, 183, 15)
     students.add_column_ex_progress(15, 'Charon:PROJECT/project3 - Defense (Tegelik)', 15, 40)
 
+    print(f"Students frame {MemoryReport.get_df_memory_mb(students.df)} MB, "
+          f"raw grades {MemoryReport.get_df_memory_mb(students.grades)} MB")
+    students.release_grades()
     students.update_students_file(students_file)
+    return students
+
+
+def update_week(csv_path: str, students: Student, text_analyzer: TextAnalyzer, label: str = today, make_plots=True,
+                chart_cache: ChartCache = None, weekly_df=None):
+    """
+    Makes plots and labels of one week. Adds feedback to students file.
+
+    :param make_plots: False, if only students file needs feedback of the week
+    :param weekly_df: feedback of all weeks from WeeklyMetrics.read_weekly_csvs, csv is read if not provided
+    """
+    metrics = WeeklyMetrics.generate_weekly_metrics(csv_path, weekly_df, students.get_num_students())
+    if make_plots:
+        metrics.make_plots(output_dir, label, chart_cache)
+    analyzer = FeedbackAnalyzer(metrics, students.name_matcher)
+    analyzer.create_csv_of_students_with_comments(label)
+    analyzer.add_to_student_file()
+    students.add_column_support_need(metrics.get_week(), analyzer.get_student_feedback())
+    text_analyzer.add_week(metrics)
+
+
+def update_summary(students: Student, text_analyzer: TextAnalyzer, label: str = today, chart_cache: ChartCache = None):
+    """
+    Makes EX progress plots, including segment of students needing support. Exports text analysis and name report.
+    Adds columns summarizing weeks 7-15 to students file.
+    """
+    # Students frame is read again from students file below, plots are made before
+    students.make_plots(['EX11', 'EX12','EX13','EX14','EX15'], output_dir, label, chart_cache)
+    if chart_cache:
+        chart_cache.evict()
+        print(chart_cache.get_summary())
+    text_analyzer.create_csvs(output_dir, label)
+    students.name_matcher.save_report(f"{output_dir}/{label}_Nimede_sobitamine.csv")
+    students.add_column_mode_in_person(7,15, students_file)
+    students.add_column_mean_time_spent(7, 15, students_file)
+
 
-    students.make_plots(['EX11', 'EX12','EX13','EX14','EX15'], output_dir)
+def run(chart_cache: ChartCache = None, report: MemoryReport = None):
+    """
+    Processes all files in input directory: students file, feedback of each week and summary.
 
+    :param report: measures stages 'load inputs', 'students', 'week <N>' and 'summary', e.g. MemoryReport or
+        scalability.StageTimer. Stages are not measured if not given.
+    :return: Student and InputBundle
+    """
+    report = report or MemoryReport(enabled=False)
     new_csvs = WeeklyMetrics.get_weekly_csvs_from_dir(input_dir)
+    with report.stage("load inputs"):
+        inputs = load_inputs(grades, activity_log, micro_filepath, no_declaration_filepath, new_csvs)
+    with report.stage("students"):
+        students = update_students(inputs=inputs)
+    text_analyzer = TextAnalyzer()
     for new_csv in new_csvs:
-        metrics = WeeklyMetrics.generate_weekly_metrics(new_csv)
-        week = metrics.get_week()
-        metrics.make_plots(output_dir)
-        analyzer = FeedbackAnalyzer(metrics)
-        analyzer.create_csv_of_students_with_comments()
-        analyzer.add_to_student_file()
-    students.add_column_mode_in_person(7,15, students_file)
-    students.add_column_mean_time_spent(7, 15, students_file)
\ No newline at end of file
+        with report.stage(f"week {WeeklyMetrics.extract_week_from_filename(new_csv)}"):
+            update_week(new_csv, students, text_analyzer, chart_cache=chart_cache, weekly_df=inputs.weekly_df)
+    with report.stage("summary"):
+        update_summary(students, text_analyzer, chart_cache=chart_cache)
+    return students, inputs
+
+
+def watch():
+    """
+    Reprocesses only new or changed files in input directory. New weekly csv updates plots and labels of that week.
+    New grades, log or lists update students file, EX progress plots and feedback of all weeks in students file.
+    """
+    watcher = InputWatcher(input_dir)
+    text_analyzer = TextAnalyzer()
+    chart_cache = ChartCache()
+    state = {"students": None}
+
+    def process_changes(changes):
+        """
+        Updates output of changed files.
+
+        :return: list of weekly csvs that could not be processed
+        """
+        changed_csvs = changes.get("weekly", [])
+        csvs_to_add = changed_csvs
+        if "students" in changes or state["students"] is None:
+            log_filepath = InputWatcher.get_newest_file(input_dir, prefix=log_prefix) or activity_log
+            grades_filepath = InputWatcher.get_newest_file(input_dir, keyword=grades_keyword) or grades
+            state["students"] = update_students(log_filepath, grades_filepath=grades_filepath)
+            # Students file was created again from grades, feedback of all weeks is added again
+            csvs_to_add = WeeklyMetrics.get_weekly_csvs_from_dir(input_dir)
+        try:
+            weekly_df = WeeklyMetrics.read_weekly_csvs(csvs_to_add)
+        except Exception as error:
+            # Each csv is read separately in update_week, so only malformed csv fails
+            print(f"Weekly csvs not read together: {error!r}")
+            weekly_df = None
+        failed = []
+        for csv_path in csvs_to_add:
+            try:
+                update_week(csv_path, state["students"], text_analyzer, watch_label,
+                            make_plots=csv_path in changed_csvs, chart_cache=chart_cache, weekly_df=weekly_df)
+            except Exception as error:
+                print(f"Skipped {csv_path}: {error!r}")
+                failed.append(csv_path)
+        try:
+            update_summary(state["students"], text_analyzer, watch_label, chart_cache)
+        except ValueError:
+            print("Summary columns not updated, waiting for more weekly feedback.")
+        return failed
+
+    watcher.watch(process_changes)
+
+
+if __name__ == "__main__":
+    os.makedirs(input_dir, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+
+    if "--watch" in sys.argv:
+        watch()
+    else:
+        # Peak memory per stage is measured with --memory
+        memory_report = MemoryReport(enabled="--memory" in sys.argv)
+        run(ChartCache(), memory_report)
+        memory_report.save_report(f"{output_dir}/{today}_Malukasutus.csv")
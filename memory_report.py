@@ -0,0 +1,106 @@
+"""Measures peak memory of pipeline stages."""
+
+
+from contextlib import contextmanager
+import os
+import threading
+
+import pandas as pd
+
+# Stages using more memory are marked in report
+memory_budget_mb = 500
+# Resident memory is sampled this often during a stage
+sample_interval_seconds = 0.01
+
+
+def get_rss_mb():
+    """
+    Current resident memory (RSS) of the process. Includes memory of pyarrow strings and other native buffers,
+    which tracemalloc does not see.
+
+    :return: float or None if not available
+    """
+    try:
+        # psutil is optional, /proc is used on Linux without it
+        import psutil
+        return psutil.Process().memory_info().rss / 1024 / 1024
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            resident_pages = int(file.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class MemoryReport:
+    """
+    Measures peak resident memory (RSS) of each stage. RSS is sampled in a background thread, so sampling is
+    off by default.
+
+    :param enabled: if False, stages are not measured.
+    :param budget_mb: peak memory allowed per stage.
+    """
+
+    def __init__(self, enabled: bool = True, budget_mb: float = memory_budget_mb):
+        self.enabled = enabled
+        self.budget_mb = budget_mb
+        self.stages = []
+        if self.enabled and get_rss_mb() is None:
+            print("Memory report needs psutil or /proc, stages are not measured.")
+            self.enabled = False
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Measures peak memory of code in with-block.
+
+        :param name: stage name in report
+        """
+        if not self.enabled:
+            yield
+            return
+        start = get_rss_mb()
+        peak = [start]
+        stop = threading.Event()
+
+        def sample():
+            while not stop.wait(sample_interval_seconds):
+                peak[0] = max(peak[0], get_rss_mb())
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            sampler.join()
+            current = get_rss_mb()
+            peak_mb = max(peak[0], current)
+            self.stages.append({
+                "stage": name,
+                "peak_mb": round(peak_mb, 1),
+                "peak_above_start_mb": round(peak_mb - start, 1),
+                "retained_mb": round(current - start, 1),
+                "over_budget": peak_mb > self.budget_mb
+            })
+
+    @staticmethod
+    def get_df_memory_mb(df: pd.DataFrame) -> float:
+        """Memory of dataframe including strings."""
+        if df is None:
+            return 0.0
+        return round(df.memory_usage(deep=True).sum() / 1024 / 1024, 1)
+
+    def get_report(self) -> pd.DataFrame:
+        return pd.DataFrame(self.stages, columns=["stage", "peak_mb", "peak_above_start_mb", "retained_mb", "over_budget"])
+
+    def save_report(self, filepath):
+        if not self.enabled:
+            return
+        report = self.get_report()
+        print(f"Memory budget {self.budget_mb} MB per stage:\n{report.to_string(index=False)}")
+        os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+        report.to_csv(filepath, index=False, encoding='utf-8-sig')
+        print("Generated file \"{filepath}\"".format(filepath=filepath))
@@ -0,0 +1,191 @@
+"""Matches student names from feedback, logs and lists to names in grades."""
+
+
+from collections import Counter, defaultdict
+from itertools import permutations
+import unicodedata
+
+import pandas as pd
+
+ngram_size = 3
+# Only best candidates by shared n-grams are compared with edit distance
+max_candidates = 10
+# Edit distance allowed per this many characters of name, but not more than max_distance
+chars_per_edit = 8
+# Names with more parts are compared only in given and sorted order
+max_permuted_tokens = 4
+
+
+class NameMatcher:
+    """
+    Resolves names to full names in grades. Index is built once: exact lookup by name, then by normalized key,
+    then candidates from n-gram index are compared with bounded edit distance.
+
+    :param full_names: full names from grades, used as canonical names.
+    :param max_distance: largest edit distance accepted as match.
+    """
+
+    def __init__(self, full_names, max_distance: int = 2):
+        self.max_distance = max_distance
+        self.full_names = set()
+        self.names_by_key = defaultdict(list)
+        self.keys = []
+        self.ngram_index = defaultdict(list)
+        self.resolved = {}
+        self.report = []
+        self.build_index(full_names)
+
+    @staticmethod
+    def normalize(name) -> str:
+        """
+        Makes key independent of case, diacritics, spacing and order of first and last name.
+        Only diacritics are removed, so names in other alphabets (e.g. Cyrillic) keep their letters.
+
+        :param name: full name
+        :return: str
+        """
+        name = unicodedata.normalize('NFKD', str(name))
+        name = "".join(char for char in name if not unicodedata.combining(char))
+        name = name.casefold().replace('-', ' ')
+        return " ".join(sorted(name.split()))
+
+    @staticmethod
+    def make_ngrams(key: str) -> set:
+        """N-grams of each name part, so they do not depend on order of parts."""
+        ngrams = set()
+        for token in key.split():
+            padded = f" {token} "
+            ngrams.update(padded[i:i + ngram_size] for i in range(len(padded) - ngram_size + 1))
+        return ngrams
+
+    @staticmethod
+    def get_orders(key: str) -> set:
+        """
+        Orders of name parts to compare with sorted key of candidate. A typo can change sorted order of parts,
+        e.g. 'Mari Masikas' is sorted as 'mari masikas' but 'Mari Maasikas' as 'maasikas mari'.
+
+        :return: set of keys
+        """
+        tokens = key.split()
+        if len(tokens) > max_permuted_tokens:
+            return {key}
+        return {" ".join(order) for order in permutations(tokens)}
+
+    def build_index(self, full_names):
+        for name in pd.Series(full_names).dropna().unique():
+            self.full_names.add(name)
+            key = self.normalize(name)
+            if key not in self.names_by_key:
+                key_id = len(self.keys)
+                self.keys.append(key)
+                for ngram in self.make_ngrams(key):
+                    self.ngram_index[ngram].append(key_id)
+            self.names_by_key[key].append(name)
+
+    @staticmethod
+    def edit_distance(first: str, second: str, bound: int) -> int:
+        """
+        Levenshtein distance, computation stops when distance exceeds bound.
+
+        :return: distance or bound + 1
+        """
+        if abs(len(first) - len(second)) > bound:
+            return bound + 1
+        previous = list(range(len(second) + 1))
+        for i, char_first in enumerate(first, 1):
+            current = [i]
+            for j, char_second in enumerate(second, 1):
+                current.append(min(previous[j] + 1, current[j - 1] + 1,
+                                   previous[j - 1] + (char_first != char_second)))
+            if min(current) > bound:
+                return bound + 1
+            previous = current
+        return previous[-1]
+
+    def match(self, name):
+        """
+        Helper function to find canonical name.
+
+        :param name:
+        :return: (canonical name or None, status, candidates)
+        """
+        # Different students can have same key, e.g. 'Jüri Tamm' and 'Juri Tamm'
+        if name in self.full_names:
+            return name, "exact", [name]
+        key = self.normalize(name)
+        if key in self.names_by_key:
+            names = self.names_by_key[key]
+            if len(names) == 1:
+                return names[0], "normalized", names
+            return None, "ambiguous", names
+
+        ngrams = self.make_ngrams(key)
+        shared = Counter()
+        for ngram in ngrams:
+            shared.update(self.ngram_index.get(ngram, ()))
+        bound = min(self.max_distance, len(key) // chars_per_edit)
+        # Every edit changes at most ngram_size n-grams, candidates sharing fewer cannot be within bound
+        min_shared = len(ngrams) - ngram_size * bound
+        orders = self.get_orders(key)
+        distances = {}
+        for key_id, num_shared in shared.most_common(max_candidates):
+            if num_shared < min_shared:
+                break
+            distance = min(self.edit_distance(order, self.keys[key_id], bound) for order in orders)
+            if distance <= bound:
+                distances[key_id] = distance
+        if not distances:
+            return None, "unmatched", []
+
+        best = min(distances.values())
+        best_names = [name for key_id, distance in distances.items() if distance == best
+                      for name in self.names_by_key[self.keys[key_id]]]
+        if len(best_names) > 1:
+            return None, "ambiguous", best_names
+        return best_names[0], "fuzzy", best_names
+
+    def resolve(self, name, source: str = "", allow_fuzzy: bool = True):
+        """
+        Finds full name in grades. Result is remembered, so every distinct name is matched once.
+
+        :param name: name from feedback, logs or lists
+        :param source: file or stage, shown in report
+        :param allow_fuzzy: if False, fuzzy match is not used, it is reported as 'fuzzy_unconfirmed' for a person
+            to confirm. Distinct names can be 1 edit apart, e.g. 'Jaan Saar' and 'Jaana Saar'.
+        :return: full name in grades or None
+        """
+        if (name, source, allow_fuzzy) not in self.resolved:
+            full_name, status, candidates = self.match(name)
+            if status == "fuzzy" and not allow_fuzzy:
+                self.resolved[(name, source, allow_fuzzy)] = None
+                status = "fuzzy_unconfirmed"
+            else:
+                self.resolved[(name, source, allow_fuzzy)] = full_name
+            if status not in ("exact", "normalized"):
+                self.report.append({"source": source, "name": name, "status": status,
+                                    "full_name": full_name, "candidates": "; ".join(candidates)})
+        return self.resolved[(name, source, allow_fuzzy)]
+
+    def resolve_all(self, names, source: str = "", allow_fuzzy: bool = True) -> pd.Series:
+        """
+        Resolves Series or list of names.
+
+        :param allow_fuzzy: see resolve
+        :return: Series of full names in grades, None if not matched
+        """
+        names = pd.Series(names)
+        unique_names = names.dropna().unique()
+        full_names = {name: self.resolve(name, source, allow_fuzzy) for name in unique_names}
+        return names.map(full_names)
+
+    def get_report(self) -> pd.DataFrame:
+        """Returns fuzzy, ambiguous and unmatched names."""
+        return pd.DataFrame(self.report, columns=["source", "name", "status", "full_name", "candidates"])
+
+    def save_report(self, filepath):
+        report = self.get_report()
+        status_counts = report['status'].value_counts().to_dict()
+        print(f"Name matching: {status_counts if status_counts else 'all names matched exactly'}")
+        # Encoding specified to enable opening in Excel
+        report.to_csv(filepath, index=False, encoding='utf-8-sig')
+        print("Generated file \"{filepath}\"".format(filepath=filepath))
@@ -3,16 +3,23 @@
 
 import numpy as np
 import pandas as pd
+import matplotlib
 import matplotlib.pyplot as plt
 from matplotlib.colors import LinearSegmentedColormap
 
+from chart_cache import ChartCache
+
+# Increase if plotting code changes (layout, labels, colours), cached plots of old version are then not used
+chart_version = 1
+
 
 class Plot:
-    def __init__(self, font_family='Verdana', font_size=14, fig_size=(13, 8)):
+    def __init__(self, font_family='Verdana', font_size=14, fig_size=(13, 8), cache: ChartCache = None):
         self.font_family = font_family
         self.font_size = font_size
         self.fig_size = fig_size
         self.title_padding = 30
+        self.cache = cache
 
         plt.rcParams['font.family'] = self.font_family
         plt.rcParams['font.size'] = self.font_size
@@ -22,11 +29,32 @@ class Plot:
         plt.figure(figsize=self.fig_size)
         plt.title(title, fontsize=self.font_size + 2, pad=self.title_padding, fontweight='bold')
 
-    def save_plot(self, file_path):
-        """Save the plot if a file path is provided."""
+    def save_plot(self, file_path, cache_key=None):
+        """Save the plot if a file path is provided. Store in cache if cache key is provided."""
         if file_path:
             plt.savefig(file_path, bbox_inches='tight')
             print(f"Plot saved to: {file_path}")
+            if self.cache and cache_key:
+                self.cache.put(cache_key, file_path)
+            # Free memory of figure after saving
+            plt.close('all')
+
+    def make_cache_key(self, chart_type, data, title, color_map=None):
+        """
+        Hash of aggregated data, chart type, title, colours, plot settings, chart_version and matplotlib version.
+        None if cache is not used.
+        """
+        if not self.cache:
+            return None
+        settings = (self.font_family, self.font_size, self.fig_size, self.title_padding, chart_version,
+                    matplotlib.__version__)
+        return self.cache.make_key(chart_type, data, title, color_map, settings)
+
+    def load_cached_plot(self, cache_key, file_path):
+        """Copy plot from cache instead of rendering it. Returns True on cache hit."""
+        if not cache_key or not file_path:
+            return False
+        return self.cache.get(cache_key, file_path)
 
     def make_labels(self, category_counts):
         """Generate labels with percentages for the pie chart."""
@@ -36,13 +64,14 @@ class Plot:
     def plot_pie_chart(self, data, column, title, color_map, file_path=None):
         """Plot a pie chart using instance settings."""
         category_counts = data[column].value_counts().sort_index()
-        # Change for "Tempo"
-        category_counts.index = category_counts.index.str.replace('Liiga kiire – liiga rasked ülesanded', 'Liiga rasked ülesanded')
-        category_counts.index = category_counts.index.str.replace('Liiga kiire – liiga suur ülesannete hulk', 'Liiga palju ülesandeid')
 
         # Get colors for categories, default to black if not found
         category_colors = [color_map.get(category, "#000000") for category in category_counts.index]
 
+        cache_key = self.make_cache_key('pie', category_counts, title, color_map)
+        if self.load_cached_plot(cache_key, file_path):
+            return
+
         # Create figure and set title
         self.create_figure(title)
 
@@ -54,11 +83,15 @@ class Plot:
             radius=0.6
         )
         plt.axis('equal')  # Equal aspect ratio ensures the pie chart is drawn as a circle.
-        self.save_plot(file_path)
+        self.save_plot(file_path, cache_key)
         # plt.show()
 
     def plot_box_and_whisker_diagram(self, data, column, title, file_path=None):
         """Plot a vertical box plot with default whiskers, but no outliers, and ensure lower whisker is not below min."""
+        cache_key = self.make_cache_key('box', data[column], title)
+        if self.load_cached_plot(cache_key, file_path):
+            return
+
         # Create figure and set title
         self.create_figure(title)
 
@@ -112,7 +145,7 @@ class Plot:
         # Remove the top and right spines (axes)
         ax.spines['top'].set_visible(False)
         ax.spines['right'].set_visible(False)
-        self.save_plot(file_path)
+        self.save_plot(file_path, cache_key)
         # plt.show()
 
     def plot_histogram(self, data, column, title, legend, file_path=None):
@@ -120,6 +153,10 @@ class Plot:
 
         rating_counts = data[column].value_counts().sort_index()
 
+        cache_key = self.make_cache_key('histogram', rating_counts, title, legend)
+        if self.load_cached_plot(cache_key, file_path):
+            return
+
         # Create figure and set title
         self.create_figure(title)
 
@@ -155,13 +192,20 @@ class Plot:
         legend_text = "\n".join([f"{key}: {value}" for key, value in legend.items()])
         plt.text(0.05, 0.95, legend_text, transform=ax.transAxes, fontsize=self.font_size - 4,
                  verticalalignment='top', bbox=dict(facecolor='white', alpha=0.8, edgecolor='none'))
-        self.save_plot(file_path)
+        self.save_plot(file_path, cache_key)
         # plt.show()
 
     def plot_stacked_bar_chart(self, data, title, color_map, file_path=None):
         """Plot a stacked bar chart to show the distribution of statuses across multiple columns."""
         category_sums = data.apply(lambda x: x.value_counts(normalize=True).fillna(0)).T * 100  # Convert to percentage
         category_sums = category_sums.fillna(0)
+        self.plot_stacked_percentages(category_sums, title, color_map, file_path)
+
+    def plot_stacked_percentages(self, category_sums, title, color_map, file_path=None):
+        """Plot a stacked bar chart from precomputed percentages (rows: columns, columns: statuses)."""
+        cache_key = self.make_cache_key('stacked_bar', category_sums, title, color_map)
+        if self.load_cached_plot(cache_key, file_path):
+            return
 
         self.create_figure(title)
         # Create the bar chart
@@ -204,3 +248,6 @@ class Plot:
         plt.tight_layout(pad=2.0)
         if file_path:
             plt.savefig(file_path, bbox_inches='tight')
+            if self.cache and cache_key:
+                self.cache.put(cache_key, file_path)
+            plt.close('all')
@@ -0,0 +1,298 @@
+"""Runs the pipeline on generated datasets of growing size and compares stage timings with a stored baseline.
+
+Usage:
+    python scalability.py                       # 1x, 10x and 100x of current course size
+    python scalability.py --scales 1 10 100 1000  # 1000x is opt-in, writing its grades xlsx takes long
+    python scalability.py --scales 1 10         # only given sizes
+    python scalability.py --save-baseline       # store results as new baseline
+"""
+
+
+import argparse
+from contextlib import contextmanager
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from weekly_metrics import column_mapping
+
+# Current course size
+base_num_students = 370
+# 1000x (370 000 x 200 grades xlsx written with openpyxl) is run only if given in --scales
+default_scales = [1, 10, 100]
+weeks = range(7, 16)
+feedback_rate = 0.6
+log_rows_per_student = 5
+log_end = "2024-12-01"
+num_grades_columns = 200
+
+work_dir = "output/scalability"
+baseline_filepath = "scalability_baseline.json"
+# Stage is slower than baseline if it takes this much longer
+regression_tolerance = 0.25
+# Exponent of time ~ size^k above this is flagged as super-linear
+superlinear_exponent = 1.2
+
+defence_columns = [
+    'Charon:EX/ex01_beginning - Defense (Tegelik)', 'Charon:EX/ex02_loops - Defense (Tegelik)',
+    'Charon:EX/ex03_validation - Defense (Tegelik)', 'Charon:EX/ex04_lists - Defense (Tegelik)',
+    'Charon:PROJECT/project1 - Defense (Tegelik)', 'Charon:EX/ex06_airport - Defense (Tegelik)',
+    'Charon:EX/ex07_regex - Defense (Tegelik)', 'Charon:EX/ex08_recursion - Defense (Tegelik)',
+    'Charon:EX/ex09_file_handling - Defense (Tegelik)', 'Charon:PROJECT/project2 - Defense (Tegelik)',
+    'Charon:EX/ex12_router - Defense (Tegelik)', 'Charon:OP/op13_football - Defense (Tegelik)',
+    'Charon:OP/op14_spaceship - Defense (Tegelik)', 'Charon:PROJECT/project3 - Defense (Tegelik)'
+]
+
+first_names = ["Mari", "Jüri", "Tõnu", "Ülle", "Kärt", "Peeter", "Liis", "Märt", "Kadri", "Andres"]
+last_names = ["Tamm", "Saar", "Sepp", "Mägi", "Kask", "Rebane", "Õunapuu", "Pärn", "Kuusk", "Lepik"]
+feedback_words = ("ülesanne oli huvitav raske tsükkel funktsioon selge arusaamatu praktikum abiõppejõud "
+                  "aitas kiire testid juhend aega").split()
+answers = {
+    "self_perception": ["Väga positiivne", "Pigem positiivne", "Neutraalne", "Pigem negatiivne", "Väga negatiivne"],
+    "usefulness": ["Ei õppinud üldse", "Ei oska öelda", "Õppisin väga palju", "Õppisin natuke"],
+    "tempo": ["Liiga kiire – liiga rasked ülesanded", "Liiga kiire – liiga suur ülesannete hulk", "Paras",
+              "Pisut aeglane"],
+    "in_person": ["Jah", "Ei, sest ei leidnud aega", "Ei, sest ei olnud vaja"],
+    "good_teachers": ["Anna Kask", "Anna Kask, Mihkel Mets", None]
+}
+
+
+def generate_dataset(dataset_dir: str, num_students: int, seed: int = 0):
+    """
+    Writes Moodle-like input files: grades xlsx, log xlsx, micro.txt, no_declaration.txt and weekly CSVs.
+    Column positions and defence column names match main.py.
+
+    :param dataset_dir: directory with 'input' subdirectory
+    :param num_students: number of students in grades
+    """
+    rng = np.random.default_rng(seed)
+    random.seed(seed)
+    input_dir = os.path.join(dataset_dir, "input")
+    os.makedirs(input_dir, exist_ok=True)
+
+    first = rng.choice(first_names, num_students)
+    last = [f"{name}{i}" for i, name in enumerate(rng.choice(last_names, num_students))]
+    full_names = [f"{a} {b}" for a, b in zip(first, last)]
+
+    grades = {
+        "Eesnimi": first, "Perekonnanimi": last,
+        "Kasutajanimi": [f"user{i}" for i in range(num_students)],
+        "Meiliaadress": [f"user{i}@example.com" for i in range(num_students)],
+        "Rühmad": rng.choice(np.array(["Rühm 1", "Rühm 2", "Rühm 3, Rühm 4", None], dtype=object), num_students)
+    }
+    for position in range(len(grades), num_grades_columns - len(defence_columns)):
+        grades[f"Charon:EX/task{position} (Tegelik)"] = rng.choice(np.array(["-", 0, 2.5, 5, 7.5], dtype=object), num_students)
+    for col in defence_columns:
+        grades[col] = rng.choice(np.array(["-", 0, 1], dtype=object), num_students)
+    pd.DataFrame(grades).to_excel(os.path.join(input_dir, "ITI0102-2024 Hinded.xlsx"), index=False)
+
+    num_log_rows = num_students * log_rows_per_student
+    minutes_ago = pd.to_timedelta(rng.integers(0, 60 * 24 * 40, num_log_rows), unit='min')
+    log_times = (pd.Timestamp(log_end) - minutes_ago).strftime('%d/%m/%y, %H:%M:%S')
+    pd.DataFrame({
+        "Kasutaja täisnimi": rng.choice(full_names, num_log_rows),
+        "Aeg": log_times
+    }).to_excel(os.path.join(input_dir, "logs_ITI0102-2024_20241210-0926.xlsx"), index=False)
+
+    with open(os.path.join(input_dir, "micro.txt"), 'w') as file:
+        file.write("\n".join(random.sample(full_names, num_students // 4)))
+    with open(os.path.join(input_dir, "no_declaration.txt"), 'w') as file:
+        file.write("\n".join(random.sample(full_names, num_students // 30)))
+
+    headers = {value: key for key, value in column_mapping.items()}
+    num_responses = int(num_students * feedback_rate)
+    for week in weeks:
+        respondents = rng.choice(full_names, num_responses, replace=False)
+        feedback = {
+            "full_name": respondents, "groups": "Rühm 1", "username": "user", "email": "user@example.com",
+            "date": "1 oktoober 2024",
+            "time_spent": rng.choice(["1", "2", "3,5", "5", "4-6", "8", "12", "20"], num_responses),
+            "likability": rng.integers(1, 11, num_responses),
+            "good_text": [" ".join(random.choices(feedback_words, k=6)) for _ in range(num_responses)],
+            "negative_text": [" ".join(random.choices(feedback_words, k=4)) for _ in range(num_responses)],
+            "teachers_text": [" ".join(random.choices(feedback_words, k=5)) for _ in range(num_responses)]
+        }
+        for col, options in answers.items():
+            feedback[col] = [random.choice(options) for _ in range(num_responses)]
+        df_week = pd.DataFrame(feedback).rename(columns=headers)
+        df_week.to_csv(os.path.join(input_dir, f"Iganädalane tagasiside – {week}. nädal.csv"), index=False)
+
+
+def get_peak_rss_mb():
+    """Peak resident memory of this process and its finished child processes. None if not available (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    usage_self = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    usage_children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(usage_self, usage_children) / unit, 1)
+
+
+class StageTimer:
+    """Measures wall time of stages of main.run. Stages 'week <N>' are summed into stage 'weekly feedback'."""
+
+    def __init__(self):
+        self.seconds = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        name = "weekly feedback" if name.startswith("week ") else name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0) + time.perf_counter() - start
+
+
+def run_pipeline(dataset_dir: str) -> dict:
+    """
+    Runs main.run on dataset and measures its stages. Runs in its own process, so peak memory is per dataset.
+    Output of previous run (including token cache) is removed first, so every run starts cold.
+
+    :return: dict with number of students, responses, stage timings and peak memory
+    """
+    os.chdir(dataset_dir)
+    import main
+
+    shutil.rmtree(main.output_dir, ignore_errors=True)
+    os.makedirs(main.output_dir, exist_ok=True)
+    timer = StageTimer()
+    wall_start = time.perf_counter()
+    students, inputs = main.run(report=timer)
+
+    # Throughput denominators come from data, not from constants
+    num_students = students.get_num_students()
+    num_responses = len(inputs.weekly_df)
+    items_by_stage = {"load inputs": num_students + num_responses, "students": num_students,
+                      "weekly feedback": num_responses, "summary": num_students}
+    stages = [{"stage": name, "seconds": seconds, "items": items_by_stage[name],
+               "items_per_second": items_by_stage[name] / seconds if seconds else None}
+              for name, seconds in timer.seconds.items()]
+    return {
+        "num_students": num_students,
+        "num_responses": num_responses,
+        "wall_seconds": time.perf_counter() - wall_start,
+        "peak_rss_mb": get_peak_rss_mb(),
+        "stages": stages
+    }
+
+
+def run_scale(scale: int, scale_dir: str) -> dict:
+    """Generates dataset if missing and runs pipeline in a new process."""
+    num_students = base_num_students * scale
+    if not os.path.exists(os.path.join(scale_dir, "input")):
+        print(f"Generating dataset {scale}x ({num_students} students) in {scale_dir}")
+        generate_dataset(scale_dir, num_students)
+    result_filepath = os.path.join(scale_dir, "result.json")
+    print(f"Running pipeline {scale}x ({num_students} students)")
+    subprocess.run([sys.executable, os.path.abspath(__file__), "--run-one", os.path.abspath(scale_dir),
+                    "--result", os.path.abspath(result_filepath)], check=True, stdout=subprocess.DEVNULL)
+    with open(result_filepath, 'r', encoding='utf-8') as file:
+        result = json.load(file)
+    result["scale"] = scale
+    return result
+
+
+def fit_scaling(results: list) -> pd.DataFrame:
+    """
+    Fits time ~ size^k per stage on log-log scale.
+
+    :param results: results of run_scale
+    :return: df with exponent per stage and flag for super-linear stages
+    """
+    rows = [{"stage": stage["stage"], "num_students": result["num_students"], "seconds": stage["seconds"]}
+            for result in results for stage in result["stages"]]
+    rows += [{"stage": "total", "num_students": result["num_students"], "seconds": result["wall_seconds"]}
+             for result in results]
+    df = pd.DataFrame(rows)
+    fits = []
+    for stage, df_stage in df.groupby('stage', sort=False):
+        if df_stage['num_students'].nunique() < 2:
+            continue
+        exponent = np.polyfit(np.log(df_stage['num_students']), np.log(df_stage['seconds'].clip(lower=1e-6)), 1)[0]
+        fits.append({"stage": stage, "exponent": round(exponent, 2), "superlinear": exponent > superlinear_exponent})
+    return pd.DataFrame(fits, columns=["stage", "exponent", "superlinear"])
+
+
+def find_regressions(results: list, baseline: dict) -> list:
+    """
+    Compares stage timings of each scale with baseline.
+
+    :return: list of messages about stages slower than baseline
+    """
+    regressions = []
+    for result in results:
+        baseline_result = baseline.get(str(result["scale"]))
+        if not baseline_result:
+            continue
+        baseline_seconds = {stage["stage"]: stage["seconds"] for stage in baseline_result["stages"]}
+        for stage in result["stages"]:
+            allowed = baseline_seconds.get(stage["stage"], float("inf")) * (1 + regression_tolerance)
+            if stage["seconds"] > allowed:
+                regressions.append(f"{result['scale']}x {stage['stage']}: {stage['seconds']:.1f} s, "
+                                   f"baseline {baseline_seconds[stage['stage']]:.1f} s")
+    return regressions
+
+
+def print_results(results: list, fits: pd.DataFrame):
+    rows = [{"scale": f"{result['scale']}x", "students": result["num_students"], "stage": stage["stage"],
+             "seconds": round(stage["seconds"], 2), "items/s": round(stage["items_per_second"] or 0, 1),
+             "peak_rss_mb": result["peak_rss_mb"]}
+            for result in results for stage in result["stages"]]
+    print(pd.DataFrame(rows).to_string(index=False))
+    if not fits.empty:
+        print(f"\nScaling exponents (time ~ students^k, k > {superlinear_exponent} is super-linear):")
+        print(fits.to_string(index=False))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=int, nargs="+", default=default_scales)
+    parser.add_argument("--work-dir", default=work_dir)
+    parser.add_argument("--baseline", default=baseline_filepath)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_one:
+        result = run_pipeline(args.run_one)
+        with open(args.result, 'w', encoding='utf-8') as file:
+            json.dump(result, file, indent=2)
+        return 0
+
+    results = [run_scale(scale, os.path.join(args.work_dir, f"{scale}x")) for scale in args.scales]
+    fits = fit_scaling(results)
+    print_results(results, fits)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump({str(result["scale"]): result for result in results}, file, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline in {args.baseline}, run with --save-baseline to store one.")
+        return 0
+    with open(args.baseline, 'r', encoding='utf-8') as file:
+        baseline = json.load(file)
+    regressions = find_regressions(results, baseline)
+    if regressions:
+        print("\nSlower than baseline:\n" + "\n".join(regressions))
+        return 1
+    print("\nNo stage slower than baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
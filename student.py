@@ -6,6 +6,10 @@ from datetime import datetime
 from openpyxl.utils.exceptions import IllegalCharacterError
 
 from plot import Plot
+from chart_cache import ChartCache
+from cohort import Cohorts
+from name_matcher import NameMatcher
+from input_loader import InputBundle, read_name_list
 import pandas as pd
 import os
 
@@ -21,9 +25,6 @@ today = datetime.now().strftime("%Y-%m-%d_%H-%M")
 # Output goes here
 checked_log = "output/log_checked_weekly_data.log"
 
-# !!! Get automatically from grades in the future.
-all_students = 366
-
 activity_log_column_mapping = {
     "Kasutaja täisnimi":"full_name",
     "Aeg":"time"
@@ -35,6 +36,9 @@ grades_column_mapping = {
     "Meiliaadress": "email"
 }
 
+# Identity columns of grades are kept in the narrow students frame, other grades columns only in raw grades
+core_grades_columns = ["Eesnimi", "Perekonnanimi", "groups", "username", "email"]
+
 color_map_progress = {
     "alustamata": "#e4067e",
     "alustatud, <10 p": "#aa1352",
@@ -43,6 +47,19 @@ color_map_progress = {
     "kaitstud": "#4dbed2"
 }
 
+# Segments with fixed titles and file names, other segments are named after the segment
+cohorts_titles = {
+    "Kõik tudengid": "Iganädalaste EX ülesannete lahendamine",
+    "Mikrokraad": "EX ülesannete lahendamine. Mikrokraad",
+    "Mitte-mikrokraad": "EX ülesannete lahendamine. Mitte-mikrokraad"
+}
+
+cohorts_file_names = {
+    "Kõik tudengid": "k6ik_tudengid",
+    "Mikrokraad": "mikro",
+    "Mitte-mikrokraad": "mitte_mikro"
+}
+
 legend_last_active = {
     "0": "täna külastatud",
     "5": "5 päeva tagasi",
@@ -53,15 +70,23 @@ legend_last_active = {
 class Student:
     """
     Finds students from Moodle csv file. -> To be replaced with xlsx!!!
+    Students frame (self.df) is narrow: identity, flags, activity and derived progress. All 180+ grades columns are
+    kept separately in self.grades and used only when weekly points are summed.
 
     :param grades_filepath: The filename containing students grades data.
+    :param inputs: InputBundle from input_loader.load_inputs, files are read here if not provided.
     """
-    def __init__(self, grades_filepath, log_filepath: str = activity_log):
+    def __init__(self, grades_filepath, log_filepath: str = activity_log, inputs: InputBundle = None):
         self.df = None
+        self.grades = None
+        self.grades_filepath = grades_filepath
+        self.inputs = inputs
+        self.name_matcher = None
+        # Number of students with declaration, set when grades are read
+        self.num_students = 0
         self.generate_student_df(grades_filepath)
         self.remove_no_declaration_students()
         self.add_column_student_activity(log_filepath)
-        self.num_students = 0
 
     def generate_student_df(self, grades_filepath: str):
         """
@@ -70,14 +95,40 @@ class Student:
         :param grades_filepath: grades file
         :return: DataFrame containing student data.
         """
-        self.update_df_from_students_file(grades_filepath)
-        self.df.rename(columns=grades_column_mapping, inplace=True)
+        if self.inputs:
+            grades = self.inputs.grades
+            # Bundle does not keep raw grades alive, so release_grades() frees them
+            self.inputs.grades = None
+        else:
+            grades = pd.read_excel(grades_filepath)
+        self.grades = grades.rename(columns=grades_column_mapping)
+        self.df = self.grades[[col for col in core_grades_columns if col in self.grades.columns]].copy()
         self.df['full_name'] = self.df['Eesnimi'] + ' ' + self.df['Perekonnanimi']
+        self.name_matcher = NameMatcher(self.df['full_name'])
+
+    def get_grades(self) -> pd.DataFrame:
+        """
+        Returns raw grades with original column order. Reads grades file again, if grades were released.
+
+        :return: DataFrame with all grades columns, same index as students frame
+        """
+        if self.grades is None:
+            self.grades = pd.read_excel(self.grades_filepath).rename(columns=grades_column_mapping)
+        return self.grades
+
+    def release_grades(self):
+        """Frees raw grades after weekly points and progress columns are added."""
+        self.grades = None
 
     def remove_no_declaration_students(self, custom_no_declaration_filepath=no_declaration_filepath):
         students_before = len(self.df)
-        with open(custom_no_declaration_filepath, 'r') as file:
-            no_declaration_students = file.read().splitlines()
+        if self.inputs:
+            no_declaration_students = self.inputs.no_declaration_students
+        else:
+            no_declaration_students = read_name_list(custom_no_declaration_filepath)
+        # Typo must not remove another student, fuzzy matches are only reported
+        no_declaration_students = self.name_matcher.resolve_all(no_declaration_students, custom_no_declaration_filepath,
+                                                                 allow_fuzzy=False).dropna()
         # Remove rows where student is in no_declaration_students
         self.df = self.df[~self.df['full_name'].isin(no_declaration_students)]
         students_after = len(self.df)
@@ -89,16 +140,17 @@ class Student:
         Reads a file containing microdegree student identifiers and adds a 'micro' column to the DataFrame
         with True/False values depending on whether the students full name is in the microdegree list.
         """
-        with open(micro_filepath, 'r') as file:
-            micro_students = file.read().splitlines()
+        micro_students = self.inputs.micro_students if self.inputs else read_name_list(micro_filepath)
         print(f"{len(micro_students)} microdegree students")
+        micro_students = self.name_matcher.resolve_all(micro_students, micro_filepath, allow_fuzzy=False).dropna()
         self.df['micro'] = self.df['full_name'].isin(micro_students)
 
     def add_column_weekly_points_without_defence(self, first_index: int, last_index: int, col_name_week: int):
-        selected_columns = self.df.iloc[:, first_index:last_index]
+        # Indexes are positions of columns in grades file
+        selected_columns = self.get_grades().iloc[:, first_index:last_index].loc[self.df.index]
         selected_columns = selected_columns.apply(pd.to_numeric, errors='coerce')
         print("I summed these columns:")
-        for col in self.df.columns[first_index:last_index]:
+        for col in selected_columns.columns:
             print(col)
         self.df[col_name_week] = selected_columns.sum(axis=1)
 
@@ -132,9 +184,11 @@ class Student:
 
     def add_column_ex_progress(self, points_without_defence, defence, col_name_week, full_points=15):
         self.df[points_without_defence] = pd.to_numeric(self.df[points_without_defence], errors='coerce')
-        self.df[defence] = pd.to_numeric(self.df[defence], errors='coerce')
+        # Defence column is read from grades, it is not added to students frame
+        defence_points = pd.to_numeric(self.get_grades().loc[self.df.index, defence], errors='coerce')
 
-        self.df[f"EX{col_name_week}"] = self.df.apply(lambda row: self.label_ex_progress(row[points_without_defence], row[defence], full_points), axis=1)
+        self.df[f"EX{col_name_week}"] = [self.label_ex_progress(points, defence_point, full_points)
+                                         for points, defence_point in zip(self.df[points_without_defence], defence_points)]
         # Add placeholder for feedback
         # self.df[f"{col_name_week}_feedback"] = "ei_vastanud" - did not work
 
@@ -145,9 +199,14 @@ class Student:
         :param log_filepath:
         :return: DataFrame containing activity column.
         """
-        df_students = pd.read_excel(log_filepath)
-        df_students.rename(columns=activity_log_column_mapping, inplace=True)
-        df_students['full_name'].dropna(inplace=True)
+        if self.inputs:
+            df_students = self.inputs.activity_log
+            self.inputs.activity_log = None
+        else:
+            df_students = pd.read_excel(log_filepath)
+        df_students = df_students.rename(columns=activity_log_column_mapping)
+        df_students['full_name'] = self.name_matcher.resolve_all(df_students['full_name'], log_filepath)
+        df_students.dropna(subset=['full_name'], inplace=True)
         df_students['last_active'] = datetime.today() - pd.to_datetime(df_students['time'],
                                                                        format='%d/%m/%y, %H:%M:%S')        # df_students['last_active'] = datetime.today() - pd.to_datetime(df_students['time'])        #df_students['full_name'] = df_students['Eesnimi'] + " " + df_students['Perekonnanimi']
         df_students['last_active'] = df_students['last_active'].dt.days
@@ -167,6 +226,19 @@ class Student:
         self.df.to_excel(excel_filename, index=False)
         print("Created new file {excel_filename}".format(excel_filename=excel_filename))
 
+    def add_column_support_need(self, week, df_feedback: pd.DataFrame):
+        """
+        Adds auto-generated comments of the week to students frame, used by support need segment.
+
+        :param week: week number, column is named '<week>_probleemid' like in students file
+        :param df_feedback: FeedbackAnalyzer.get_student_feedback()
+        """
+        auto_comments = df_feedback.set_index('full_name')['auto_comment']
+        self.df[f"{week}_probleemid"] = self.df['full_name'].map(auto_comments)
+
+    def get_num_students(self) -> int:
+        return self.num_students
+
     def get_all_students_names(self):
         """
         Retrieves the list of student names from the DataFrame.
@@ -240,28 +312,35 @@ class Student:
         self.df[f'Mood_kohapeal_N{range_first}-{range_last}'] = modes
         self.update_students_file(students_file)
 
-    def make_plots(self, list_of_columns, output_dir):
-        plotter = Plot()
+    def make_cohorts(self):
+        """
+        Precomputes student segments: all, microdegree, lab groups, activity recency and support need.
+
+        :return: Cohorts
+        """
+        cohorts = Cohorts(self.df)
+        cohorts.add_all_students()
+        cohorts.add_micro_segments()
+        cohorts.add_group_segments()
+        cohorts.add_activity_segments()
+        cohorts.add_support_segment()
+        return cohorts
+
+    def make_plots(self, list_of_columns, output_dir, label: str = today, chart_cache: ChartCache = None):
+        plotter = Plot(cache=chart_cache)
         interval = f"{list_of_columns[0]}-{list_of_columns[-1]}"
-        overlapping_path = f"{output_dir}/{today}_Graafikud_EX_progress_{interval}"
+        overlapping_path = f"{output_dir}/{label}_Graafikud_EX_progress_{interval}"
         os.makedirs(overlapping_path, exist_ok=True)
-        title = f"Iganädalaste EX ülesannete lahendamine ({len(self.df)})"
-        full_path = f"{overlapping_path}/{today}_EX_k6ik_tudengid_{interval}.png"
-        ex_df = self.df[list_of_columns]
-        plotter.plot_stacked_bar_chart(ex_df, title, color_map_progress, full_path)
-
-        micro_students_df = self.df[self.df['micro'] == True]
-        title = f"EX ülesannete lahendamine. Mikrokraad ({len(micro_students_df)})"
-        full_path = f"{overlapping_path}/{today}_EX_mikro_{interval}.png"
-        ex_df = micro_students_df[list_of_columns]
-        plotter.plot_stacked_bar_chart(ex_df, title, color_map_progress, full_path)
-
-        not_micro_students_df = self.df[self.df['micro'] == False]
-        title = f"EX ülesannete lahendamine. Mitte-mikrokraad ({len(not_micro_students_df)})"
-        full_path = f"{overlapping_path}/{today}_EX_mitte_mikro_{interval}.png"
-        ex_df = not_micro_students_df[list_of_columns]
-        plotter.plot_stacked_bar_chart(ex_df, title, color_map_progress, full_path)
+
+        cohorts = self.make_cohorts()
+        counts = cohorts.count_progress(list_of_columns)
+        for segment in cohorts.segments:
+            title = f"{cohorts_titles.get(segment, f'EX ülesannete lahendamine. {segment}')} ({cohorts.get_size(segment)})"
+            file_part = cohorts_file_names.get(segment, Cohorts.make_filename_part(segment))
+            full_path = f"{overlapping_path}/{label}_EX_{file_part}_{interval}.png"
+            percentages = cohorts.progress_percentages(counts, segment)
+            plotter.plot_stacked_percentages(percentages, title, color_map_progress, full_path)
 
         title = f"Päevi viimasest kursuse külastamisest ({len(self.df)})"
-        full_path = f"{overlapping_path}/{today}_Paevi_kursuse_kulastamisest.png"
+        full_path = f"{overlapping_path}/{label}_Paevi_kursuse_kulastamisest.png"
         plotter.plot_histogram(self.df, 'last_active', title, legend_last_active, full_path)
@@ -0,0 +1,225 @@
+"""Counts keywords, themes and teacher mentions in free-text weekly feedback."""
+
+
+from datetime import datetime
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from weekly_metrics import WeeklyMetrics
+
+today = datetime.now().strftime("%Y-%m-%d_%H-%M")
+
+# Tokens are cached by hash of response text, so reprocessing old weeks does not tokenize again
+token_cache_filepath = "output/token_cache.json"
+# Increase if tokenizing rules change, old cache is then discarded
+tokenizer_version = 1
+
+text_columns = ["good_text", "negative_text", "teachers_text"]
+teachers_column = "good_teachers"
+
+# Words with Estonian letters, digits are not keywords
+token_pattern = r"[a-zäöüõšž]+"
+min_token_length = 3
+
+stopwords_estonian = {
+    "aga", "ainult", "alati", "eriti", "ehk", "enam", "kõik", "kõike", "kas", "kes", "kogu", "kuid",
+    "kui", "kuidas", "kuna", "kus", "mida", "mina", "minu", "mind", "mis", "mul", "mulle", "nagu",
+    "natuke", "need", "neid", "nii", "ning", "nüüd", "oleks", "olen", "oli", "olid", "oma", "ole",
+    "olla", "oleme", "palju", "pole", "rohkem", "sai", "sain", "seal", "sest", "see", "seda",
+    "selle", "selles", "siin", "siis", "sellest", "teda", "tema", "ehkki", "jah", "juba", "just",
+    "veel", "vaid", "väga", "või", "üks", "ühe", "üle", "samuti", "ikka", "kuigi", "osa", "oled",
+    "sellega", "mingi", "mingit", "midagi", "pigem", "mõni", "mõned", "seega", "tundub", "tegelikult"
+}
+
+# Theme is found if a token starts with any of the stems
+themes = {
+    "ajakulu ja tempo": ["ajakulu", "ajapuudu", "kiire", "tempo"],
+    "raskus ja arusaamatus": ["raske", "keeruli", "arusaamatu", "segane", "segadus", "ebaselge", "keeru"],
+    "huvi": ["huvitav", "põnev", "meeldi", "lõbus"],
+    "ülesande juhend": ["juhend", "ülesandepüstitus", "selgitus", "kirjeldus", "näide", "näited"],
+    "testid ja kontroll": ["test", "charon", "kontroll", "punkt"],
+    "praktikum ja abi": ["praktikum", "abiõppejõ", "õppejõ", "loeng", "küsimus"]
+}
+
+# Short words are matched as whole tokens. As stems they match unrelated words:
+# 'lahe' - 'lahendus', 'abi' - 'abil', 'tund' - 'tundsin', 'aja' - 'ajalugu'
+theme_words = {
+    "ajakulu ja tempo": ["aeg", "aega", "aja", "ajal", "ajaga", "kaua", "tund", "tundi", "tunde", "tunni",
+                         "tunnid", "tunniga"],
+    "huvi": ["lahe", "lahedad", "lahedalt", "lahedam", "tore", "toredad", "toredalt", "toredam"],
+    "praktikum ja abi": ["abi", "abiks", "abist", "abita"]
+}
+
+
+class TextAnalyzer:
+    """
+    Tokenizes free-text feedback in batches and collects term, theme and teacher mention counts per week.
+
+    :param cache_filepath: json file with tokens keyed by hash of response text.
+    """
+
+    def __init__(self, cache_filepath: str = token_cache_filepath):
+        self.cache_filepath = cache_filepath
+        self.token_cache = self.load_token_cache()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Counts by csv file, so a file processed again replaces its counts and two exports of a week are kept
+        self.term_counts = {}
+        self.theme_counts = {}
+        self.teacher_counts = {}
+        self.theme_by_stem = self.make_theme_lookup()
+        self.theme_by_word = {word: theme for theme, words in theme_words.items() for word in words}
+
+    def load_token_cache(self) -> dict:
+        """Reads token cache. Cache from another tokenizer version is ignored."""
+        if not os.path.exists(self.cache_filepath):
+            return {}
+        with open(self.cache_filepath, 'r', encoding='utf-8') as file:
+            cache = json.load(file)
+        if cache.get("version") != tokenizer_version:
+            return {}
+        return cache.get("tokens", {})
+
+    def save_token_cache(self):
+        os.makedirs(os.path.dirname(self.cache_filepath) or ".", exist_ok=True)
+        with open(self.cache_filepath, 'w', encoding='utf-8') as file:
+            json.dump({"version": tokenizer_version, "tokens": self.token_cache}, file, ensure_ascii=False)
+        print(f"Token cache: {self.cache_hits} hits, {self.cache_misses} misses. Saved to {self.cache_filepath}")
+
+    @staticmethod
+    def hash_text(text: str) -> str:
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def make_theme_lookup() -> dict:
+        """Maps stem to theme."""
+        return {stem: theme for theme, stems in themes.items() for stem in stems}
+
+    def tokenize_batch(self, texts: pd.Series) -> pd.Series:
+        """
+        Tokenizes all texts at once. Only unique texts missing from the cache are tokenized.
+
+        :param texts: Series of responses, may contain NaN
+        :return: Series of token lists with the same index
+        """
+        texts = texts.dropna().astype(str).str.strip()
+        texts = texts[texts != ""]
+        unique_texts = pd.Series(texts.unique(), dtype=object)
+        keys = unique_texts.map(self.hash_text)
+        is_cached = keys.isin(self.token_cache.keys())
+        self.cache_hits += int(is_cached.sum())
+        self.cache_misses += int((~is_cached).sum())
+
+        if not is_cached.all():
+            new_tokens = unique_texts[~is_cached].str.lower().str.findall(token_pattern)
+            new_tokens = new_tokens.map(
+                lambda tokens: [token for token in tokens
+                                if len(token) >= min_token_length and token not in stopwords_estonian])
+            self.token_cache.update(zip(keys[~is_cached], new_tokens))
+
+        tokens_by_text = dict(zip(unique_texts, keys.map(self.token_cache)))
+        return texts.map(tokens_by_text)
+
+    def label_theme(self, token: str):
+        """
+        Helper function to find theme of a token by whole word, then by its stem.
+
+        :param token:
+        :return: str or None
+        """
+        if token in self.theme_by_word:
+            return self.theme_by_word[token]
+        for length in range(len(token), 2, -1):
+            theme = self.theme_by_stem.get(token[:length])
+            if theme:
+                return theme
+        return None
+
+    def add_week(self, weekly_metrics: WeeklyMetrics):
+        """
+        Counts terms, themes and teacher mentions of one week.
+
+        :param weekly_metrics: WeeklyMetrics
+        """
+        df = weekly_metrics.get_weekly_df()
+        week = weekly_metrics.get_week()
+        source = weekly_metrics.get_csv_filepath()
+        filename = os.path.basename(source)
+        columns = [col for col in text_columns if col in df.columns]
+
+        long_df = df[columns].melt(var_name='column', value_name='text').dropna(subset=['text'])
+        long_df['token'] = self.tokenize_batch(long_df['text'])
+        long_df = long_df.explode('token').dropna(subset=['token'])
+
+        terms = long_df.groupby(['column', 'token']).size().rename('count').reset_index()
+        terms.insert(0, 'exercise', f"EX{week}")
+        terms.insert(0, 'week', week)
+        terms.insert(1, 'file', filename)
+        self.term_counts[source] = terms
+
+        unique_tokens = pd.Series(long_df['token'].unique(), dtype=object)
+        theme_by_token = dict(zip(unique_tokens, unique_tokens.map(self.label_theme)))
+        long_df['theme'] = long_df['token'].map(theme_by_token)
+        # Count responses, not tokens, mentioning the theme
+        responses = long_df.dropna(subset=['theme']).reset_index().drop_duplicates(subset=['index', 'column', 'theme'])
+        themes_week = responses.groupby(['column', 'theme']).size().rename('count').reset_index()
+        themes_week.insert(0, 'exercise', f"EX{week}")
+        themes_week.insert(0, 'week', week)
+        themes_week.insert(1, 'file', filename)
+        self.theme_counts[source] = themes_week
+
+        if teachers_column in df.columns:
+            teachers = df[teachers_column].dropna().astype(str).str.split(r"[;,\n]").explode().str.strip()
+            teachers = teachers[teachers != ""]
+            teachers_week = teachers.value_counts().rename_axis('teacher').rename('count').reset_index()
+            teachers_week.insert(0, 'week', week)
+            teachers_week.insert(1, 'file', filename)
+            self.teacher_counts[source] = teachers_week
+
+    def get_term_counts(self) -> pd.DataFrame:
+        return pd.concat(self.term_counts.values(), ignore_index=True) if self.term_counts else pd.DataFrame()
+
+    def get_theme_counts(self) -> pd.DataFrame:
+        return pd.concat(self.theme_counts.values(), ignore_index=True) if self.theme_counts else pd.DataFrame()
+
+    def get_teacher_counts(self) -> pd.DataFrame:
+        return pd.concat(self.teacher_counts.values(), ignore_index=True) if self.teacher_counts else pd.DataFrame()
+
+    def get_term_trends(self, top_n=30) -> pd.DataFrame:
+        """
+        Makes table of most frequent terms with one column per week.
+
+        :param top_n: number of terms per text column
+        :return: DataFrame indexed by (column, term)
+        """
+        terms = self.get_term_counts()
+        if terms.empty:
+            return terms
+        totals = terms.groupby(['column', 'token'])['count'].sum()
+        top_terms = totals.groupby(level='column', group_keys=False).nlargest(top_n).index
+        trends = terms.pivot_table(index=['column', 'token'], columns='week', values='count', aggfunc='sum', fill_value=0)
+        return trends.loc[trends.index.isin(top_terms)]
+
+    def create_csvs(self, output_dir, label: str = today):
+        """
+        Exports term trends, themes and teacher mentions. Saves token cache.
+
+        :param output_dir: output directory
+        :param label: prefix of output folder and files, date and time by default
+        """
+        path_to_output = f"{output_dir}/{label}_Tagasiside_tekstianalyys"
+        os.makedirs(path_to_output, exist_ok=True)
+        exports = {
+            "Terminid_nadalati": self.get_term_trends(),
+            "Teemad_nadalati": self.get_theme_counts(),
+            "Abioppejoudude_kiitused": self.get_teacher_counts()
+        }
+        for name, df in exports.items():
+            filepath = f"{path_to_output}/{label}_{name}.csv"
+            # Encoding specified to enable opening in Excel
+            df.to_csv(filepath, index=isinstance(df.index, pd.MultiIndex), encoding='utf-8-sig')
+            print("Generated file \"{filepath}\"".format(filepath=filepath))
+        self.save_token_cache()
@@ -0,0 +1,158 @@
+"""Watches input directory and reports new or changed Moodle exports."""
+
+
+import json
+import os
+import time
+import traceback
+
+# Processed files and their signatures, kept between runs
+watch_state_filepath = "output/watch_state.json"
+poll_interval_seconds = 30
+
+# Input files by stage
+weekly_suffix = ".csv"
+log_prefix = "logs_"
+grades_keyword = "Hinded"
+list_filenames = ["micro.txt", "no_declaration.txt"]
+
+
+class InputWatcher:
+    """
+    Polls input directory like WeeklyMetrics.get_weekly_csvs_from_dir and reports files that are new
+    or changed since they were last processed. File is reported only after its size and modification time
+    stay the same for two polls, so files still being copied are not read.
+
+    :param input_dir: directory with Moodle exports.
+    :param state_filepath: json file with signatures of processed files.
+    """
+
+    def __init__(self, input_dir: str, state_filepath: str = watch_state_filepath):
+        self.input_dir = input_dir
+        self.state_filepath = state_filepath
+        self.processed = self.load_state()
+        self.previous_scan = {}
+        # Files that failed are not marked processed, they are tried again when changed or after restart
+        self.failed = {}
+
+    def load_state(self) -> dict:
+        if not os.path.exists(self.state_filepath):
+            return {}
+        with open(self.state_filepath, 'r', encoding='utf-8') as file:
+            return json.load(file)
+
+    def save_state(self):
+        os.makedirs(os.path.dirname(self.state_filepath) or ".", exist_ok=True)
+        with open(self.state_filepath, 'w', encoding='utf-8') as file:
+            json.dump(self.processed, file, ensure_ascii=False, indent=2)
+
+    def scan(self) -> dict:
+        """
+        Finds input files with their signatures.
+
+        :return: dict of filepath: [modification time, size]
+        """
+        signatures = {}
+        for root, dirs, files in os.walk(self.input_dir, topdown=False):
+            for filename in files:
+                if self.get_stage(filename) is None:
+                    continue
+                fullpath = os.path.join(root, filename)
+                try:
+                    stat = os.stat(fullpath)
+                except FileNotFoundError:
+                    continue
+                signatures[fullpath] = [stat.st_mtime_ns, stat.st_size]
+        return signatures
+
+    @staticmethod
+    def get_stage(filename: str):
+        """
+        Helper function to find which stage uses the file.
+
+        :param filename:
+        :return: 'weekly', 'students' or None
+        """
+        if filename.endswith(weekly_suffix):
+            return "weekly"
+        if filename.endswith(".xlsx") and (filename.startswith(log_prefix) or grades_keyword in filename):
+            return "students"
+        if filename in list_filenames:
+            return "students"
+        return None
+
+    def get_changes(self) -> dict:
+        """
+        Compares scan with processed files.
+
+        :return: dict of stage: list of new or changed filepaths
+        """
+        scan = self.scan()
+        changes = {}
+        for filepath, signature in scan.items():
+            is_stable = self.previous_scan.get(filepath) == signature
+            is_new = self.processed.get(filepath) != signature and self.failed.get(filepath) != signature
+            if is_stable and is_new:
+                stage = self.get_stage(os.path.basename(filepath))
+                changes.setdefault(stage, []).append(filepath)
+        self.previous_scan = scan
+        return changes
+
+    def mark_processed(self, changes: dict, failed=()):
+        """
+        Stores signatures of processed files.
+
+        :param changes: dict of stage: list of filepaths
+        :param failed: filepaths that could not be processed, they are remembered until changed
+        """
+        for filepaths in changes.values():
+            for filepath in filepaths:
+                if filepath in failed:
+                    self.failed[filepath] = self.previous_scan[filepath]
+                else:
+                    self.processed[filepath] = self.previous_scan[filepath]
+                    self.failed.pop(filepath, None)
+        self.save_state()
+
+    def watch(self, process_changes, interval: int = poll_interval_seconds):
+        """
+        Polls input directory until interrupted. Calls process_changes(changes) when files are new or changed.
+        Errors are printed and polling goes on, so one malformed export does not stop watching.
+
+        :param process_changes: function that takes dict of stage: list of filepaths, returns list of failed filepaths
+        :param interval: seconds between polls
+        """
+        print(f"Watching {self.input_dir} every {interval} s. Stop with Ctrl+C.")
+        self.previous_scan = self.scan()
+        try:
+            while True:
+                time.sleep(interval)
+                changes = self.get_changes()
+                if changes:
+                    print(f"\n---\nNew or changed files: {changes}")
+                    try:
+                        failed = process_changes(changes) or []
+                    except Exception:
+                        traceback.print_exc()
+                        failed = [filepath for filepaths in changes.values() for filepath in filepaths]
+                    if failed:
+                        print(f"Not processed, tried again when changed: {failed}")
+                    self.mark_processed(changes, failed)
+        except KeyboardInterrupt:
+            print("Stopped watching.")
+
+    @staticmethod
+    def get_newest_file(dirname: str, prefix: str = "", keyword: str = "", suffix: str = ".xlsx"):
+        """
+        Finds most recently modified file, e.g. newest log export.
+
+        :return: filepath or None
+        """
+        matching_files = []
+        for root, dirs, files in os.walk(dirname):
+            for filename in files:
+                if filename.startswith(prefix) and keyword in filename and filename.endswith(suffix):
+                    matching_files.append(os.path.join(root, filename))
+        if not matching_files:
+            return None
+        return max(matching_files, key=os.path.getmtime)
@@ -1,16 +1,17 @@
 """Labels and creates plots from weekly student feedback."""
 
 
+import csv
 import os
 from datetime import datetime
 import pandas as pd
 import re
 from plot import Plot
+from chart_cache import ChartCache
 
 weekly_feedback_dir = "input"
 
 today = datetime.now().strftime("%Y-%m-%d_%H-%M")
-all_students = 372
 
 column_mapping = {
     "Kasutaja täisnimi": "full_name",
@@ -30,6 +31,25 @@ column_mapping = {
     "Siin saad soovi korral abiõppejõudusid nimeliselt kiita (vali kuni 3 nime).": "good_teachers"
 }
 
+# Moodle headers differ in whitespace between exports, mapping is looked up by normalized header
+def normalize_header(header: str) -> str:
+    return " ".join(str(header).replace("\ufeff", "").split())
+
+
+normalized_column_mapping = {normalize_header(key): value for key, value in column_mapping.items()}
+
+category_columns = ["self_perception", "usefulness", "tempo", "in_person"]
+numeric_columns = ["likability"]
+hours_columns = ["time_spent"]
+
+# Long answers are shortened once when reading, not every time a plot is drawn
+category_labels = {
+    "tempo": {
+        "Liiga kiire – liiga rasked ülesanded": "Liiga rasked ülesanded",
+        "Liiga kiire – liiga suur ülesannete hulk": "Liiga palju ülesandeid"
+    }
+}
+
 color_map_self_perception = {
     "Väga positiivne": "#e4067e",
     "Pigem positiivne": "#aa1352",
@@ -72,15 +92,20 @@ class WeeklyMetrics:
     WeeklyMetrics class for calculating median statistics of student data per week.
     """
 
-    def __init__(self, csv_filepath: str):
+    def __init__(self, csv_filepath: str, weekly_df: pd.DataFrame = None):
         """
         Initializes the WeeklyMetrics with data from a CSV file.
 
         :param csv_filepath: The csv filepath containing weekly data.
+        :param weekly_df: feedback of several weeks from read_weekly_csvs, csv is not read again if provided.
         """
         self.csv_filepath = csv_filepath
-        self.df = self.generate_weekly_df()
         self.week = self.extract_week_from_filename(self.csv_filepath)
+        if weekly_df is None:
+            self.df = self.generate_weekly_df()
+        else:
+            # Rows are selected by file, two exports of the same week are not mixed
+            self.df = weekly_df[weekly_df['source'] == self.csv_filepath].reset_index(drop=True)
         self.num_students = self.df.shape[0] # num rows
         self.median_time_spent = self.calculate_median_time_spent()
 
@@ -90,10 +115,100 @@ class WeeklyMetrics:
 
         :return: df
         """
-        df_week = pd.read_csv(self.csv_filepath, sep=',')
-        df_week.rename(columns=column_mapping, inplace=True)
+        return self.read_weekly_csvs([self.csv_filepath])
+
+    @staticmethod
+    def read_weekly_csv(csv_filepath: str) -> pd.DataFrame:
+        """
+        Reads only mapped columns of one csv as strings, with short column names and columns 'week' and 'source'.
+
+        :param csv_filepath:
+        :return: df
+        """
+        with open(csv_filepath, 'r', encoding='utf-8-sig', newline='') as file:
+            header = next(csv.reader(file), [])
+        rename = {col: normalized_column_mapping[normalize_header(col)] for col in header
+                  if normalize_header(col) in normalized_column_mapping}
+        try:
+            df_week = pd.read_csv(csv_filepath, sep=',', usecols=list(rename), dtype=str, engine='pyarrow',
+                                  encoding='utf-8-sig')
+        except (ImportError, ValueError):
+            # pyarrow is optional
+            df_week = pd.read_csv(csv_filepath, sep=',', usecols=list(rename), dtype=str, encoding='utf-8-sig')
+        df_week = df_week.rename(columns=rename)
+        df_week.insert(0, 'week', WeeklyMetrics.extract_week_from_filename(csv_filepath))
+        df_week.insert(1, 'source', csv_filepath)
         return df_week
 
+    @staticmethod
+    def read_weekly_csvs(csv_filepaths) -> pd.DataFrame:
+        """
+        Reads feedback of all weeks into one typed df with columns 'week' and 'source' (csv filepath).
+        Answers are typed once for all weeks.
+
+        :param csv_filepaths: list of weekly csv filepaths
+        :return: df
+        """
+        return WeeklyMetrics.combine_weekly_dfs([WeeklyMetrics.read_weekly_csv(path) for path in csv_filepaths])
+
+    @staticmethod
+    def combine_weekly_dfs(weekly_dfs) -> pd.DataFrame:
+        """
+        Concatenates dfs from read_weekly_csv and types answers of all weeks at once.
+
+        :param weekly_dfs: list of dfs
+        :return: df
+        """
+        if not weekly_dfs:
+            return pd.DataFrame(columns=['week', 'source'] + list(column_mapping.values()))
+        df = pd.concat(weekly_dfs, ignore_index=True)
+
+        for col in df.columns.drop(['week', 'source']):
+            df[col] = df[col].astype('string').str.strip()
+        for col in category_columns:
+            if col in df.columns:
+                df[col] = df[col].replace(category_labels.get(col, {}))
+        for col in numeric_columns:
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+        for col in hours_columns:
+            if col in df.columns:
+                df[col] = WeeklyMetrics.coerce_hours(df[col])
+        return df
+
+    @staticmethod
+    def coerce_hours(answers: pd.Series) -> pd.Series:
+        """
+        Converts time answers to hours. Range gives mean of its ends. Minutes are a number followed by
+        'min' or 'minut...', words like 'minu' or 'mingi' are not minutes.
+
+            '5'                     5.0
+            '3,5'                   3.5
+            '4-6 h'                 5.0
+            'umbes 10, mingi aeg'   10.0
+            '5 tundi minu arvates'  5.0
+            '30 min'                0.5
+            '90 minutit'            1.5
+            '1 h 30 min'            1.5
+            '2h30min'               2.5
+            '1 tund 15 minutit'     1.25
+
+        :param answers: Series of strings
+        :return: Series of floats, NaN if no number found
+        """
+        number = r'(\d+(?:\.\d+)?)'
+        answers = answers.str.replace(',', '.', regex=False).str.lower()
+        ends = answers.str.extract(number + r'(?:\s*[-–]\s*' + number + ')?')
+        hours = ends.astype(float).mean(axis=1)
+
+        is_minutes = answers.str.contains(r'\d\s*min(?:ut\w*)?\b', regex=True).fillna(False).astype(bool)
+        hours = hours.where(~is_minutes, hours / 60)
+        # Unit of hours is letters only, e.g. 'h' or 'tund', so digits of minutes are not swallowed
+        hours_and_minutes = answers.str.extract(number + r'\s*(?:h|t)[^\W\d]*\.?\s*' + number
+                                                + r'\s*min(?:ut\w*)?\b').astype(float)
+        with_minutes = hours_and_minutes.notna().all(axis=1)
+        return hours.where(~with_minutes, hours_and_minutes[0] + hours_and_minutes[1] / 60)
+
     @staticmethod
     def get_weekly_csvs_from_dir(dirname):
         """
@@ -114,18 +229,23 @@ class WeeklyMetrics:
         return new_csv_files
 
     @staticmethod
-    def generate_weekly_metrics(csv_path: str):
+    def generate_weekly_metrics(csv_path: str, weekly_df: pd.DataFrame = None, all_students: int = None):
         """
         Calculates general metrics for specific week.
 
         :param csv_path
+        :param weekly_df: feedback of several weeks from read_weekly_csvs, optional
+        :param all_students: number of students in grades (Student.get_num_students), optional
         :return: WeeklyMetrics
         """
-        weekly_metrics = WeeklyMetrics(csv_path)
+        weekly_metrics = WeeklyMetrics(csv_path, weekly_df)
         submissions = weekly_metrics.get_num_students()
-        percentage = '{:.1f}%'.format(submissions / all_students * 100)
         print(f"\n---\nMetrics for week {weekly_metrics.get_week()}")
-        print(f"Number of feedback submissions: {submissions}/{all_students} ({percentage})")
+        if all_students:
+            percentage = '{:.1f}%'.format(submissions / all_students * 100)
+            print(f"Number of feedback submissions: {submissions}/{all_students} ({percentage})")
+        else:
+            print(f"Number of feedback submissions: {submissions}")
         print(f"Median time spent: {weekly_metrics.get_median_time_spent()} hours\n---\n")
         return weekly_metrics
 
@@ -154,6 +274,9 @@ class WeeklyMetrics:
     def get_week(self):
         return self.week
 
+    def get_csv_filepath(self):
+        return self.csv_filepath
+
     def get_weekly_df(self):
         return self.df
 
@@ -163,32 +286,38 @@ class WeeklyMetrics:
     def get_median_time_spent(self) -> float:
         return self.median_time_spent
 
-    def make_plots(self, output_dir):
-        """Make plots from feedback."""
-        plotter = Plot()
-        overlapping_path = f"{output_dir}/{today}_Graafikud_Tagasiside_n2dalati/N{self.week}"
+    def make_plots(self, output_dir, label: str = today, chart_cache: ChartCache = None):
+        """
+        Make plots from feedback.
+
+        :param output_dir: output directory
+        :param label: prefix of output folders and files, date and time by default
+        :param chart_cache: unchanged plots are copied from cache, if provided
+        """
+        plotter = Plot(cache=chart_cache)
+        overlapping_path = f"{output_dir}/{label}_Graafikud_Tagasiside_n2dalati/N{self.week}"
         os.makedirs(overlapping_path, exist_ok=True)
 
         title = f"Enesetunne {self.week}. nädalal ({self.num_students})"
-        full_path = f"{overlapping_path}/{today}_Enesetunne_N{self.week}.png"
+        full_path = f"{overlapping_path}/{label}_Enesetunne_N{self.week}.png"
         plotter.plot_pie_chart(self.df, 'self_perception', title, color_map_self_perception, full_path)
 
         title = f"Ajakulu {self.week}. nädalal ({self.num_students})"
-        full_path = f"{overlapping_path}/{today}_Ajakulu_N{self.week}.png"
+        full_path = f"{overlapping_path}/{label}_Ajakulu_N{self.week}.png"
         plotter.plot_box_and_whisker_diagram(self.df, 'time_spent', title, full_path)
 
         title= f"Midagi kasulikku õpitud {self.week}. nädalal ({self.num_students})"
-        full_path = f"{overlapping_path}/{today}_Kasulikkus_N{self.week}.png"
+        full_path = f"{overlapping_path}/{label}_Kasulikkus_N{self.week}.png"
         plotter.plot_pie_chart(self.df, 'usefulness', title, color_map_usefulness, full_path)
 
         title= f"Aine tempo {self.week}. nädalal ({self.num_students})"
-        full_path = f"{overlapping_path}/{today}_Tempo_N{self.week}.png"
+        full_path = f"{overlapping_path}/{label}_Tempo_N{self.week}.png"
         plotter.plot_pie_chart(self.df, 'tempo', title, color_map_tempo, full_path)
 
         title= f"Hinnang ülesandele {self.week}. nädalal ({self.num_students})"
-        full_path = f"{overlapping_path}/{today}_Hinnang_ulesandele_N{self.week}.png"
+        full_path = f"{overlapping_path}/{label}_Hinnang_ulesandele_N{self.week}.png"
         plotter.plot_histogram(self.df, 'likability', title, legend_likability, full_path)
 
         title = f"Loengus või praktikumis kohapeal käimine {self.week}. nädalal ({self.num_students})"
-        full_path = f"{overlapping_path}/{today}_Kohapeal_kaimine_N{self.week}.png"
+        full_path = f"{overlapping_path}/{label}_Kohapeal_kaimine_N{self.week}.png"
         plotter.plot_pie_chart(self.df, 'in_person', title, color_map_in_person, full_path)